@@ -9,6 +9,9 @@ setup(
         "requests",
         "python-dotenv",
     ],
+    extras_require={
+        "fast": ["orjson"],
+    },
     entry_points={
         "console_scripts": [
             "omni-user-manager=omni_sync.cli:main",
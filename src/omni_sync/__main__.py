@@ -0,0 +1,7 @@
+"""Allow running the CLI as `python -m omni_sync` from an installed package, without sys.path changes."""
+import sys
+
+from .cli import main
+
+if __name__ == '__main__':
+    sys.exit(main())
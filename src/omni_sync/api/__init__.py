@@ -1,5 +1,6 @@
 import os
 from .omni_client import OmniClient
+from ..models import SCIM_PATCH_OP_SCHEMAS
 
 class OmniAPI:
     """High-level API wrapper for Omni operations"""
@@ -23,7 +24,11 @@ class OmniAPI:
     
     def get_user(self, username: str) -> dict:
         """Get a user by username"""
-        return self.client.get_user_by_username(username)
+        return self.client.get_user(username)
+    
+    def list_users(self, page_size: int = 200):
+        """Yield all users one page at a time (SCIM pagination)"""
+        return self.client.list_users(page_size)
     
     def get_users(self) -> list:
         """Get all users"""
@@ -37,6 +42,13 @@ class OmniAPI:
         """Update a group's attributes and members"""
         return self.client.update_group(group_data)
     
+    def bulk_patch_groups(self, operations: list) -> dict:
+        """
+        Submit multiple group PATCH operations in one SCIM Bulk request.
+        Returns the BulkResponse with a status for each operation.
+        """
+        return self.client.bulk_patch_groups(operations)
+    
     def get_user_by_id(self, user_id: str = None):
         """Get a user by ID, or all users if no ID is provided."""
         return self.client.get_user_by_id(user_id)
@@ -127,7 +139,7 @@ class OmniAPI:
                 results["failure"].append({"user": user, "error": "Missing 'id' or 'urn:omni:params:1.0:UserAttribute' in user data"})
                 continue
             patch_data = {
-                "schemas": ["urn:ietf:params:scim:api:messages:2.0:PatchOp"],
+                "schemas": SCIM_PATCH_OP_SCHEMAS,
                 "Operations": [
                     {
                         "op": "Replace",
@@ -1,7 +1,9 @@
 import requests
-from typing import List, Optional, Union, Dict, Any
+from requests.adapters import HTTPAdapter
+from typing import Iterator, List, Optional, Union, Dict, Any
 import json
-from ..models import User, Group
+from ..models import User, Group, SCIM_BULK_REQUEST_SCHEMAS, SCIM_LIST_RESPONSE_SCHEMAS
+from ..utils.json_utils import dumps
 import csv
 import time
 
@@ -16,12 +18,36 @@ class OmniClient:
             'Authorization': f'Bearer {api_key}',
             'Accept': 'application/scim+json'
         }
+        # userName -> user cache for get_user; cleared by any write request
+        self._users_by_username: Optional[Dict[str, Dict[str, Any]]] = None
+        # Shared session so every call reuses keep-alive connections (and TLS sessions)
+        # instead of opening a new one; auth and content headers are set once here
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
     
+    def close(self) -> None:
+        """Close the pooled connections held by the session"""
+        self.session.close()
+
+    def __enter__(self) -> 'OmniClient':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
     def _make_request(self, method: str, endpoint: str, data: Optional[dict] = None) -> dict:
         """Make an HTTP request to the Omni API"""
         url = f"{self.base_url}{endpoint}"
+        if method != 'GET':
+            # Writes may change users (or their group memberships), so drop cached lookups
+            self._users_by_username = None
         try:
-            response = requests.request(method, url, headers=self.headers, json=data)
+            # Serialize the body ourselves (orjson when available); Content-Type is already set on the session
+            body = dumps(data) if data is not None else None
+            response = self.session.request(method, url, data=body)
             response.raise_for_status()
             if response.status_code == 204:
                 return {}  # No content, but success
@@ -39,9 +65,9 @@ class OmniClient:
                 print(f"Response Text: {e.response.text}")
             raise
 
-    def _paginated_request(self, endpoint: str, count: int = 100) -> List[Dict[str, Any]]:
+    def _iter_pages(self, endpoint: str, count: int = 100, strict: bool = False) -> Iterator[List[Dict[str, Any]]]:
         """
-        Make paginated requests to the Omni SCIM API.
+        Yield pages of resources from the Omni SCIM API.
 
         SCIM 2.0 pagination uses:
         - startIndex: 1-based index of first result (default: 1)
@@ -56,11 +82,13 @@ class OmniClient:
         Args:
             endpoint: API endpoint to request (e.g., '/scim/v2/users')
             count: Number of results per page (default: 100)
+            strict: Raise if a page request fails or the listing ends short of
+                totalResults, instead of stopping quietly after the pages fetched so far
 
-        Returns:
-            List of all resources across all pages
+        Yields:
+            The list of resources on each page
         """
-        all_resources = []
+        fetched = 0
         start_index = 1
 
         while True:
@@ -70,34 +98,48 @@ class OmniClient:
 
             try:
                 response = self._make_request('GET', paginated_url)
+            except Exception as e:
+                print(f"\n❌ Error during paginated request to {endpoint}: {str(e)}")
+                if strict:
+                    raise
+                # Stop here; callers keep what has been yielded so far
+                return
 
-                # Extract resources from this page
-                resources = response.get('Resources', [])
-                all_resources.extend(resources)
+            # Extract resources from this page
+            resources = response.get('Resources', [])
+            fetched += len(resources)
+            yield resources
 
-                # Check if we need to fetch more pages
-                total_results = response.get('totalResults', 0)
-                items_per_page = response.get('itemsPerPage', len(resources))
+            # Check if we need to fetch more pages
+            total_results = response.get('totalResults', 0)
+            items_per_page = response.get('itemsPerPage', len(resources))
 
-                # If we've fetched all results, stop
-                if len(all_resources) >= total_results:
-                    break
+            # If we've fetched all results, stop
+            if fetched >= total_results:
+                return
 
-                # Move to next page
-                start_index += items_per_page
+            # Move to next page
+            start_index += items_per_page
 
-                # Safety check: if no resources returned, stop to avoid infinite loop
-                if items_per_page == 0:
-                    break
+            # Safety check: if no resources returned, stop to avoid infinite loop
+            if items_per_page == 0:
+                if strict:
+                    raise RuntimeError(f"Paginated request to {endpoint} stopped after {fetched} of {total_results} results")
+                return
 
-                # Add delay between pagination requests to avoid rate limiting
-                time.sleep(0.5)
+            # Add delay between pagination requests to avoid rate limiting
+            time.sleep(0.5)
 
-            except Exception as e:
-                print(f"\n❌ Error during paginated request to {endpoint}: {str(e)}")
-                # Return what we've collected so far
-                break
+    def _paginated_request(self, endpoint: str, count: int = 100, strict: bool = False) -> List[Dict[str, Any]]:
+        """
+        Make paginated requests to the Omni SCIM API.
 
+        Returns:
+            List of all resources across all pages
+        """
+        all_resources = []
+        for resources in self._iter_pages(endpoint, count, strict):
+            all_resources.extend(resources)
         return all_resources
 
     # User operations
@@ -109,11 +151,9 @@ class OmniClient:
         """Update an existing user"""
         if 'id' not in user:
             # Try to find the user by username
-            users = self.get_users()
-            for u in users:
-                if u.get('userName') == user.get('userName'):
-                    user['id'] = u['id']
-                    break
+            existing = self.get_user(user.get('userName'))
+            if existing:
+                user['id'] = existing['id']
             if 'id' not in user:
                 raise ValueError(f"User {user.get('userName')} not found")
         
@@ -128,21 +168,25 @@ class OmniClient:
         self._make_request('DELETE', f'/scim/v2/users/{user_id}')
     
     def get_user(self, username: str) -> Optional[Dict[str, Any]]:
-        """Get a user by username"""
+        """Get a user by username (served from a userName index built from one listing of all users)"""
         try:
-            users = self.get_users()
-            for user in users:
-                if user.get('userName') == username:
-                    return user
-            return None
+            if self._users_by_username is None:
+                # Strict listing: a failed or partial listing raises instead of being cached as complete
+                users = self._paginated_request('/scim/v2/users', count=200, strict=True)
+                self._users_by_username = {user.get('userName'): user for user in users}
+            return self._users_by_username.get(username)
         except Exception as e:
             print(f"\n❌ Error getting user {username}: {str(e)}")
             return None
     
+    def list_users(self, page_size: int = 200) -> Iterator[List[Dict[str, Any]]]:
+        """Yield all users one page at a time"""
+        return self._iter_pages('/scim/v2/users', count=page_size)
+
     def get_users(self) -> List[Dict[str, Any]]:
         """Get all users (with automatic pagination)"""
         try:
-            return self._paginated_request('/scim/v2/users')
+            return self._paginated_request('/scim/v2/users', count=200)
         except Exception as e:
             print(f"\n❌ Error getting users: {str(e)}")
             return []
@@ -170,12 +214,18 @@ class OmniClient:
         """Delete a group"""
         self._make_request('DELETE', f'/scim/v2/groups/{group_id}')
     
-    def get_groups(self) -> List[Dict[str, Any]]:
-        """Get all groups (with automatic pagination)"""
+    def get_groups(self, strict: bool = False) -> List[Dict[str, Any]]:
+        """
+        Get all groups (with automatic pagination).
+        With strict=True a failed or incomplete listing raises instead of returning
+        the groups fetched so far (or an empty list).
+        """
         try:
-            return self._paginated_request('/scim/v2/groups')
+            return self._paginated_request('/scim/v2/groups', count=200, strict=strict)
         except Exception as e:
             print(f"\n❌ Error getting groups: {str(e)}")
+            if strict:
+                raise
             return []
     
     def update_group_members(self, group_id: str, group_name: str, members: List[Dict[str, str]], display_name: str = None) -> bool:
@@ -202,6 +252,20 @@ class OmniClient:
             print(f"\n❌ Error updating members for group {group_name}: {str(e)}")
             return False
 
+    def bulk_patch_groups(self, operations: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Submit multiple group PATCH operations in one SCIM Bulk request.
+
+        Each operation is a dict such as
+        {"method": "PATCH", "path": "/groups/<id>", "data": {"Operations": [...]}}.
+        Returns the BulkResponse, whose 'Operations' list carries a status per operation.
+        """
+        bulk_data = {
+            "schemas": SCIM_BULK_REQUEST_SCHEMAS,
+            "Operations": operations
+        }
+        return self._make_request('POST', '/scim/v2/bulk', bulk_data)
+
     def get_user_by_id(self, user_id: Optional[str] = None) -> Union[Dict[str, Any], List[Dict[str, Any]], None]:
         """Get a user by ID, or all users if no ID is provided."""
         if not user_id:
@@ -364,7 +428,7 @@ class OmniClient:
         
         # Create SCIM 2.0 format structure
         scim_export = {
-            "schemas": ["urn:ietf:params:scim:api:messages:2.0:ListResponse"],
+            "schemas": SCIM_LIST_RESPONSE_SCHEMAS,
             "totalResults": len(users),
             "startIndex": 1,
             "itemsPerPage": len(users),
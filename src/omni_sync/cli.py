@@ -31,6 +31,7 @@ Data Sources:
 import argparse
 import sys
 import os
+import re
 from typing import Optional
 try:
     from dotenv import load_dotenv
@@ -50,6 +51,45 @@ from .api.omni_client import OmniClient
 from .data_sources.csv_source import CSVDataSource
 from .data_sources.json_source import JSONDataSource
 from .main import OmniSync
+from .utils.logger import configure_logging
+
+# KEY=value lines in a .env file; the value may be wrapped in double or single quotes
+_ENV_RE = re.compile(r"""(?m)^[ \t]*([A-Za-z_][A-Za-z0-9_]*)[ \t]*=[ \t]*(?:"([^"\n]*)"|'([^'\n]*)'|(.*?))[ \t]*$""")
+
+def _bootstrap_env(debug_env: bool = False) -> None:
+    """
+    Load the nearest .env file into os.environ, with .env values overriding global ones.
+    Falls back to a single-pass regex parse if python-dotenv leaves the Omni variables unset.
+    """
+    env_file_path_found = dotenv.find_dotenv(usecwd=True)
+    loaded_dotenv = load_dotenv(env_file_path_found, verbose=debug_env, override=True)
+    if debug_env:
+        print(f"DEBUG: dotenv.find_dotenv(usecwd=True) result: '{env_file_path_found}'")
+        print(f"DEBUG: load_dotenv(verbose={debug_env}, override=True) result: {loaded_dotenv}")
+    if loaded_dotenv and os.getenv('OMNI_BASE_URL') and os.getenv('OMNI_API_KEY'):
+        return
+
+    manual_keys = []
+    error = None
+    if env_file_path_found:
+        try:
+            for match in _ENV_RE.finditer(Path(env_file_path_found).read_text()):
+                key = match.group(1)
+                os.environ[key] = next(value for value in match.groups()[1:] if value is not None)
+                manual_keys.append(key)
+        except (OSError, UnicodeDecodeError) as e:
+            error = e
+    if debug_env:
+        if error is not None:
+            print(f"DEBUG: Manual parse FAILED: {error}")
+        elif not env_file_path_found:
+            print("DEBUG: .env file not found by find_dotenv for manual parse.")
+        else:
+            print(f"DEBUG: Manual parse set {len(manual_keys)} variables: {', '.join(manual_keys)}")
+            if os.getenv('OMNI_BASE_URL') and os.getenv('OMNI_API_KEY'):
+                print("DEBUG: Variables successfully set by manual parse.")
+            else:
+                print("DEBUG: Variables NOT set even after manual parse.")
 
 def main() -> int:
     """Main entry point for the CLI"""
@@ -72,6 +112,8 @@ def main() -> int:
                             help='Sync mode: all (default) syncs both groups and attributes, groups-only, or attributes-only')
     sync_parser.add_argument('--dry-run', action='store_true',
                             help='Show what changes would be made without actually making them')
+    sync_parser.add_argument('--force-refresh', action='store_true',
+                            help='Resync group memberships even if the data source is unchanged since the last sync')
     sync_parser.add_argument('--debug', action='store_true',
                             help='Enable debug print statements for .env loading')
 
@@ -128,43 +170,10 @@ def main() -> int:
 
     args = parser.parse_args()
 
-    # --- .env loading logic (applies to all commands) ---
-    debug_env = getattr(args, 'debug_env', False)
-    env_file_path_found = dotenv.find_dotenv(usecwd=True)
-    if debug_env:
-        print(f"DEBUG: dotenv.find_dotenv(usecwd=True) result: '{env_file_path_found}'")
-    loaded_dotenv = load_dotenv(env_file_path_found, verbose=debug_env, override=True)
-    if debug_env:
-        print(f"DEBUG: load_dotenv(verbose={debug_env}, override=True) result: {loaded_dotenv}")
-        print(f"DEBUG: This allows .env file values to override global environment variables")
-    if not loaded_dotenv or not os.getenv('OMNI_BASE_URL') or not os.getenv('OMNI_API_KEY'):
-        if debug_env:
-            print("DEBUG: load_dotenv failed or variables not set, attempting manual parse...")
-        if env_file_path_found and os.path.exists(env_file_path_found):
-            try:
-                with open(env_file_path_found, 'r') as f:
-                    for line_number, line in enumerate(f):
-                        line = line.strip()
-                        if not line or line.startswith('#') or '=' not in line:
-                            continue
-                        key, value = line.split('=', 1)
-                        key = key.strip()
-                        if len(value) >= 2 and ((value.startswith('"') and value.endswith('"')) or (value.startswith("'") and value.endswith("'"))):
-                            value = value[1:-1]
-                        os.environ[key] = value
-                        if debug_env:
-                            print(f"DEBUG: Manually set os.environ['{key}'] = '{value}'")
-                if os.getenv('OMNI_BASE_URL') and os.getenv('OMNI_API_KEY'):
-                    if debug_env:
-                        print("DEBUG: Variables successfully set by manual parse.")
-                elif debug_env:
-                    print("DEBUG: Variables NOT set even after manual parse.")
-            except Exception as e:
-                if debug_env:
-                    print(f"DEBUG: Manual parse FAILED: {e}")
-        elif debug_env:
-            print("DEBUG: .env file not found by find_dotenv for manual parse, or path doesn't exist.")
-    # --- End .env loading logic ---
+    # .env loading (applies to all commands)
+    _bootstrap_env(getattr(args, 'debug_env', False))
+    # Buffered console output for the sync progress messages
+    configure_logging()
     
     # For commands that require API access, check env vars before proceeding
     api_required_commands = [
@@ -215,18 +224,19 @@ def main() -> int:
         else:
             print("Error: Invalid source type")
             return 1
-        sync = OmniSync(data_source, omni_client, dry_run=args.dry_run)
+        sync = OmniSync(data_source, omni_client, dry_run=args.dry_run, force_refresh=args.force_refresh)
         if args.dry_run:
             print("🔍 DRY RUN MODE - No changes will be made")
-        if args.mode == 'all':
-            print("🔄 Running full sync (groups and attributes)")
-            results = sync.sync_all()
-        elif args.mode == 'groups':
-            print("🔄 Running groups-only sync")
-            results = sync.sync_groups()
-        elif args.mode == 'attributes':
-            print("🔄 Running attributes-only sync")
-            results = sync.sync_attributes()
+        with omni_client:
+            if args.mode == 'all':
+                print("🔄 Running full sync (groups and attributes)")
+                results = sync.sync_all()
+            elif args.mode == 'groups':
+                print("🔄 Running groups-only sync")
+                results = sync.sync_groups()
+            elif args.mode == 'attributes':
+                print("🔄 Running attributes-only sync")
+                results = sync.sync_attributes()
         return 0
     elif args.command == 'get-group-by-id':
         from .api import OmniAPI
@@ -291,18 +301,25 @@ def main() -> int:
         else:
             print("Unsupported file type. Please provide a .json or .csv file.")
             return 1
+        # If any user is missing an 'id', index all Omni users by userName with
+        # one paginated listing instead of a search request per user
+        current_by_username = {}
+        if any(not user.get('id') for user in users):
+            for page in api.list_users():
+                for omni_user in page:
+                    current_by_username[omni_user.get('userName')] = omni_user
         # Ensure each user has 'id' and 'urn:omni:params:1.0:UserAttribute'
         processed_users = []
         for user in users:
-            # If 'id' is missing, try to fetch by userName
+            # If 'id' is missing, look it up by userName
             if 'id' not in user or not user['id']:
                 userName = user.get('userName')
                 if not userName:
                     print(f"Skipping user missing both 'id' and 'userName': {user}")
                     continue
-                omni_user = api.search_users(userName)
-                if omni_user and isinstance(omni_user, list) and len(omni_user) > 0:
-                    user['id'] = omni_user[0].get('id')
+                omni_user = current_by_username.get(userName)
+                if omni_user:
+                    user['id'] = omni_user.get('id')
                 else:
                     print(f"Could not find user in Omni for userName '{userName}', skipping.")
                     continue
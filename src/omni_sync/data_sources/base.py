@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Set
+from typing import Iterator, List, Dict, Any, FrozenSet
 from ..models import User, Group
 
 class DataSource(ABC):
@@ -15,6 +15,22 @@ class DataSource(ABC):
         """Get all groups from the data source"""
         pass
     
+    def source_key(self) -> str:
+        """Identify where this source reads from (e.g. file paths), used to key persisted sync state"""
+        return type(self).__name__
+
+    def prefetch(self) -> None:
+        """Do any one-time loading or indexing up front (e.g. while API calls are in flight); optional"""
+        pass
+
+    def iter_users(self) -> Iterator[User]:
+        """Iterate over users; sources that can read incrementally override this to stream"""
+        yield from self.get_users()
+
+    def iter_groups(self) -> Iterator[Group]:
+        """Iterate over groups; sources that can read incrementally override this to stream"""
+        yield from self.get_groups()
+    
     @abstractmethod
     def update_users(self, users: List[User]) -> None:
         """Update users in the data source"""
@@ -26,6 +42,6 @@ class DataSource(ABC):
         pass
 
     @abstractmethod
-    def get_desired_groups(self, user_data: Dict[str, Any], user_id_in_omni: str) -> Set[str]:
+    def get_desired_groups(self, user_data: Dict[str, Any], user_id_in_omni: str) -> FrozenSet[str]:
         """Get the set of group IDs a user should belong to based on the source data."""
         pass
@@ -1,10 +1,17 @@
 import csv
+import sys
 from pathlib import Path
-from typing import List, Dict, Any, Set
+from typing import Iterator, List, Dict, Any, FrozenSet
 import json
+import logging
+from collections import defaultdict
 from .base import DataSource
+from ..utils.json_utils import loads
 from ..models import User, Group
 
+# Read warnings go through logging so they stay in order with the sync's buffered progress output
+log = logging.getLogger(__name__)
+
 class CSVDataSource(DataSource):
     """Data source implementation for CSV files"""
     
@@ -12,6 +19,7 @@ class CSVDataSource(DataSource):
         self.users_file = users_file
         self.groups_file = groups_file
         self._groups_data = None # Cache for groups data
+        self._user_to_groups = None # Cache for user ID -> group IDs index
         self._users_data = None # Cache for users data
         
         # Create files if they don't exist
@@ -20,87 +28,124 @@ class CSVDataSource(DataSource):
         if not Path(groups_file).exists():
             Path(groups_file).write_text("displayName,members\n")
     
+    def iter_users(self) -> Iterator[Dict[str, Any]]:
+        """Stream users from CSV one row at a time (served from the cache if already loaded)"""
+        if self._users_data is not None:
+            yield from self._users_data
+            return
+        try:
+            with open(self.users_file, 'r', encoding='utf-8', newline='') as f:
+                reader = csv.DictReader(f)
+                # Check for essential columns (adjust as needed)
+                if not all(col in reader.fieldnames for col in ['id', 'userName', 'displayName', 'active', 'email', 'userAttributes']):
+                     log.warning(f"Warning: Missing expected columns in {self.users_file}. Required: id, userName, displayName, active, email, userAttributes")
+                     # Decide how to handle: return empty, raise error, etc.
+
+                for row in reader:
+                    try:
+                        user_attributes = {}
+                        ua_raw = row.get('userAttributes', '{}')
+                        if ua_raw and ua_raw != '{}':
+                            try:
+                                user_attributes = loads(ua_raw)
+                            except json.JSONDecodeError:
+                                log.warning(f"Warning: Could not parse user attributes for user {row.get('userName', 'UNKNOWN')}")
+
+                        user = {
+                            'id': row.get('id'), # Ensure ID is present
+                            'userName': row.get('userName'),
+                            'displayName': row.get('displayName'),
+                            'active': str(row.get('active', '')).lower() == 'true',
+                            'emails': [{'value': row.get('email'), 'type': 'work'}], # Assuming one email
+                            'userAttributes': user_attributes
+                            # Note: CSV format doesn't store 'groups' directly in user row
+                        }
+                        yield user
+                    except KeyError as e:
+                        log.warning(f"Warning: Missing key {e} in user row: {row}")
+                        continue # Skip problematic row
+        except FileNotFoundError:
+            log.error(f"Error: Users file not found at {self.users_file}")
+        except Exception as e:
+            log.error(f"Error reading users file {self.users_file}: {e}")
+
     def _load_users(self):
         if self._users_data is None:
-            self._users_data = []
-            try:
-                with open(self.users_file, 'r', encoding='utf-8') as f:
-                    reader = csv.DictReader(f)
-                    # Check for essential columns (adjust as needed)
-                    if not all(col in reader.fieldnames for col in ['id', 'userName', 'displayName', 'active', 'email', 'userAttributes']):
-                         print(f"Warning: Missing expected columns in {self.users_file}. Required: id, userName, displayName, active, email, userAttributes")
-                         # Decide how to handle: return empty, raise error, etc.
-
-                    for row in reader:
-                        try:
-                            user_attributes = {}
-                            ua_raw = row.get('userAttributes', '{}')
-                            if ua_raw and ua_raw != '{}':
-                                try:
-                                    user_attributes = json.loads(ua_raw.replace('""', '"'))
-                                except json.JSONDecodeError:
-                                    print(f"Warning: Could not parse user attributes for user {row.get('userName', 'UNKNOWN')}")
-
-                            user = {
-                                'id': row.get('id'), # Ensure ID is present
-                                'userName': row.get('userName'),
-                                'displayName': row.get('displayName'),
-                                'active': str(row.get('active', '')).lower() == 'true',
-                                'emails': [{'value': row.get('email'), 'type': 'work'}], # Assuming one email
-                                'userAttributes': user_attributes
-                                # Note: CSV format doesn't store 'groups' directly in user row
-                            }
-                            self._users_data.append(user)
-                        except KeyError as e:
-                            print(f"Warning: Missing key {e} in user row: {row}")
-                            continue # Skip problematic row
-            except FileNotFoundError:
-                print(f"Error: Users file not found at {self.users_file}")
-            except Exception as e:
-                print(f"Error reading users file {self.users_file}: {e}")
+            self._users_data = list(self.iter_users())
         return self._users_data
 
+    @staticmethod
+    def _parse_members(members_raw: str, group_name: str) -> List[str]:
+        """Parse the JSON members column of a groups.csv row into a list of user IDs."""
+        if not members_raw or members_raw == '[]':
+            return []
+        try:
+            # The csv module already unescapes doubled quotes, so the cell is plain JSON
+            members = loads(members_raw)
+        except json.JSONDecodeError:
+            log.warning(f"Warning: Could not parse members for group {group_name}: {members_raw}")
+            return []
+        if not isinstance(members, list):
+            log.warning(f"Warning: Parsed members is not a list for group {group_name}")
+            return [] # Reset to empty list if parse result isn't a list
+        # Intern IDs so the same user ID shares one string across all groups
+        return [sys.intern(member) if isinstance(member, str) else member for member in members]
+
+    def iter_groups(self) -> Iterator[Dict[str, Any]]:
+        """Stream groups from CSV one row at a time (served from the cache if already loaded)"""
+        if self._groups_data is not None:
+            yield from self._groups_data
+            return
+        try:
+            with open(self.groups_file, 'r', encoding='utf-8', newline='') as f:
+                reader = csv.reader(f)
+                fieldnames = next(reader, [])
+                if not all(col in fieldnames for col in ['id', 'displayName', 'members']):
+                     log.warning(f"Warning: Missing expected columns in {self.groups_file}. Required: id, displayName, members")
+                     # Decide how to handle
+
+                # Resolve column positions once and read rows as plain lists instead
+                # of building a dict per row
+                id_index, name_index, members_index = (
+                    fieldnames.index(col) if col in fieldnames else None
+                    for col in ('id', 'displayName', 'members')
+                )
+
+                def cell(row, index):
+                    # Missing columns and short rows read as None, as with csv.DictReader
+                    return row[index] if index is not None and index < len(row) else None
+
+                for row in reader:
+                    if not row:
+                        # csv.reader yields [] for blank lines, which DictReader skipped
+                        continue
+                    group_name = cell(row, name_index)
+                    group_id = cell(row, id_index)
+                    group = {
+                        'id': sys.intern(group_id) if group_id else group_id, # Ensure ID is present
+                        'displayName': group_name,
+                        'members': self._parse_members(cell(row, members_index), group_name or 'UNKNOWN')
+                    }
+                    yield group
+        except FileNotFoundError:
+            log.error(f"Error: Groups file not found at {self.groups_file}")
+            # No groups loaded, functions relying on it will get empty data
+        except Exception as e:
+            log.error(f"Error reading groups file {self.groups_file}: {e}")
+
     def _load_groups(self):
         if self._groups_data is None:
-            self._groups_data = []
-            try:
-                with open(self.groups_file, 'r', encoding='utf-8') as f:
-                    reader = csv.DictReader(f)
-                    if not all(col in reader.fieldnames for col in ['id', 'displayName', 'members']):
-                         print(f"Warning: Missing expected columns in {self.groups_file}. Required: id, displayName, members")
-                         # Decide how to handle
-
-                    for row in reader:
-                        try:
-                            members = []
-                            members_raw = row.get('members', '[]')
-                            if members_raw and members_raw != '[]':
-                                try:
-                                    # Handle JSON string format from CSV
-                                    cleaned_str = members_raw.replace('""', '"').strip('"')
-                                    members = json.loads(cleaned_str)
-                                    if not isinstance(members, list):
-                                        print(f"Warning: Parsed members is not a list for group {row.get('displayName', 'UNKNOWN')}")
-                                        members = [] # Reset to empty list if parse result isn't a list
-                                except json.JSONDecodeError:
-                                    print(f"Warning: Could not parse members for group {row.get('displayName', 'UNKNOWN')}: {members_raw}")
-
-                            group = {
-                                'id': row.get('id'), # Ensure ID is present
-                                'displayName': row.get('displayName'),
-                                'members': members # Parsed list or empty list
-                            }
-                            self._groups_data.append(group)
-                        except KeyError as e:
-                             print(f"Warning: Missing key {e} in group row: {row}")
-                             continue # Skip problematic row
-            except FileNotFoundError:
-                print(f"Error: Groups file not found at {self.groups_file}")
-                # No groups loaded, functions relying on it will get empty data
-            except Exception as e:
-                print(f"Error reading groups file {self.groups_file}: {e}")
+            self._groups_data = list(self.iter_groups())
         return self._groups_data
 
+    def source_key(self) -> str:
+        """Identify this source by its resolved users and groups file paths"""
+        return f"csv:{Path(self.users_file).resolve()}|{Path(self.groups_file).resolve()}"
+
+    def prefetch(self) -> None:
+        """Parse groups.csv and build the user -> groups index ahead of the per-user lookups"""
+        self._load_user_groups()
+
     def get_users(self) -> List[Dict[str, Any]]:
         """Get all users from CSV"""
         return self._load_users()
@@ -109,30 +154,33 @@ class CSVDataSource(DataSource):
         """Get all groups from CSV"""
         return self._load_groups()
     
-    def _get_user_groups_from_csv(self, user_id_in_omni: str) -> Set[str]:
+    def _load_user_groups(self) -> Dict[str, FrozenSet[str]]:
+        """
+        Build (once) an index of user ID -> group IDs from the cached groups.csv data,
+        so per-user lookups don't rescan every group's members list.
+        """
+        if self._user_to_groups is None:
+            user_to_groups = defaultdict(set)
+            # Single streaming pass; the full groups list is never held in memory
+            for group in self.iter_groups():
+                # Members should be a list after parsing
+                members = group.get('members', [])
+                if isinstance(members, list):
+                    # We assume members list contains Omni User IDs
+                    for user_id in members:
+                        user_to_groups[user_id].add(group.get('id'))
+            # Freeze so lookups can hand out the shared sets without copying
+            self._user_to_groups = {user_id: frozenset(group_ids) for user_id, group_ids in user_to_groups.items()}
+        return self._user_to_groups
+
+    def _get_user_groups_from_csv(self, user_id_in_omni: str) -> FrozenSet[str]:
         """
         Get group IDs for a user based on cached groups.csv data.
         Uses the Omni user ID for matching against the members list.
         """
-        user_groups = set()
-        groups_data = self._load_groups() # Ensure groups are loaded
-        if not groups_data:
-             return set()
-             
-        for group in groups_data:
-            try:
-                # Members should be a list after _load_groups parsing
-                members = group.get('members', [])
-                if isinstance(members, list) and user_id_in_omni in members:
-                     # We assume members list contains Omni User IDs
-                    user_groups.add(group.get('id')) # Add the group's ID
-            except KeyError as e:
-                # Should be caught by _load_groups, but defensively check here too
-                print(f"Warning: Issue processing group {group.get('id', 'unknown')} for user {user_id_in_omni}: {str(e)}")
-                continue
-        return user_groups
-
-    def get_desired_groups(self, user_data: Dict[str, Any], user_id_in_omni: str) -> Set[str]:
+        return self._load_user_groups().get(user_id_in_omni, frozenset())
+
+    def get_desired_groups(self, user_data: Dict[str, Any], user_id_in_omni: str) -> FrozenSet[str]:
         """Determine desired groups for a user using the loaded groups CSV data."""
         # user_data from the CSV source is ignored here, as group membership
         # is determined by the groups file, matched by user_id_in_omni.
@@ -181,6 +229,7 @@ class CSVDataSource(DataSource):
                      writer.writerow(row)
              # Update cache
             self._groups_data = groups
+            self._user_to_groups = None
         except IOError as e:
             print(f"Error writing to groups file {self.groups_file}: {e}")
         except Exception as e:
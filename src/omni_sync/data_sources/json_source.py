@@ -1,6 +1,9 @@
 import json
-from typing import List, Dict, Any, Set
+import sys
+from pathlib import Path
+from typing import List, Dict, Any, FrozenSet
 from .base import DataSource
+from ..utils.json_utils import loads
 
 class JSONDataSource(DataSource):
     """JSON data source implementation"""
@@ -10,24 +13,32 @@ class JSONDataSource(DataSource):
         self._users = None # Cache users
 
     @staticmethod
-    def _extract_group_ids(groups_data: Any) -> Set[str]:
+    def _extract_group_ids(groups_data: Any) -> FrozenSet[str]:
         """
         Extract group IDs from various group data formats within JSON.
         Handles list of group objects: [{"display": "name", "value": "group-id"}]
-        Returns a set of group IDs.
+        and plain lists of group IDs: ["group-id"]
+        Returns a frozenset of interned group IDs.
         """
         if isinstance(groups_data, list):
-            # Handle list of group objects from JSON format
-            return {g.get('value') for g in groups_data if isinstance(g, dict) and 'value' in g}
+            group_ids = (g.get('value') if isinstance(g, dict) else g for g in groups_data)
+            return frozenset(
+                sys.intern(group_id) if isinstance(group_id, str) else group_id
+                for group_id in group_ids if group_id
+            )
         # Add handling for other potential formats if needed, otherwise return empty
-        return set()
+        return frozenset()
 
     def _load_data(self):
         if self._data is None:
             try:
-                with open(self.users_file, 'r') as f:
-                    self._data = json.load(f)
-                    self._users = self._data.get('Resources', [])
+                with open(self.users_file, 'rb') as f:
+                    data = loads(f.read())
+                if not isinstance(data, dict):
+                    print(f"Error: Expected a JSON object with a 'Resources' list in {self.users_file}")
+                    data = {}
+                self._data = data
+                self._users = data.get('Resources', [])
             except FileNotFoundError:
                 print(f"Error: Users file not found at {self.users_file}")
                 self._data = {} # Prevent repeated load attempts
@@ -42,6 +53,14 @@ class JSONDataSource(DataSource):
         self._load_data()
         return self._data
 
+    def source_key(self) -> str:
+        """Identify this source by its resolved users file path"""
+        return f"json:{Path(self.users_file).resolve()}"
+
+    def prefetch(self) -> None:
+        """Read and parse the JSON file ahead of iteration"""
+        self._load_data()
+
     def get_users(self) -> List[Dict[str, Any]]:
         self._load_data()
         return self._users
@@ -80,7 +99,7 @@ class JSONDataSource(DataSource):
         print("Warning: update_groups called on JSONDataSource. Group updates should be handled by updating users.")
         pass # Or raise NotImplementedError if this should never be called
 
-    def get_desired_groups(self, user_data: Dict[str, Any], user_id_in_omni: str) -> Set[str]:
+    def get_desired_groups(self, user_data: Dict[str, Any], user_id_in_omni: str) -> FrozenSet[str]:
         """Extract desired group IDs from the user's data in the JSON source."""
         # user_id_in_omni is ignored here as groups are directly in user_data
         return self._extract_group_ids(user_data.get('groups', [])) 
\ No newline at end of file
@@ -1,19 +1,37 @@
 from typing import List, Dict, Any
 from .api.omni_client import OmniClient
 from .data_sources.base import DataSource
+from .models import SCIM_PATCH_OP_SCHEMAS, SCIM_USER_SCHEMAS
+from .utils.logger import flush_logger
+from .sync_state import DEFAULT_STATE_FILE, groups_digest, load_sync_state, save_sync_state
 # These specific imports might not be needed anymore directly here
 # from .data_sources.csv_source import CSVDataSource
 # from .data_sources.json_source import JSONDataSource
 import json
+import logging
 import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Per-user/per-group progress messages; the CLI buffers them (see utils.logger), summaries are printed directly
+log = logging.getLogger(__name__)
 
 class OmniSync:
     """Main class for synchronizing data between a data source and Omni"""
 
-    def __init__(self, data_source: DataSource, omni_client: OmniClient, dry_run: bool = False):
+    # Maximum number of group operations sent in a single SCIM Bulk request
+    BULK_FLUSH_SIZE = 100
+    # Per-operation Bulk statuses meaning the PATCH itself is unsupported; those groups are retried with PUT
+    BULK_UNSUPPORTED_STATUSES = frozenset({'404', '405', '501'})
+
+    def __init__(self, data_source: DataSource, omni_client: OmniClient, dry_run: bool = False,
+                 force_refresh: bool = False, state_file: str = DEFAULT_STATE_FILE):
         self.data_source = data_source
         self.omni_client = omni_client
         self.dry_run = dry_run
+        self.force_refresh = force_refresh
+        self.state_file = state_file
+        # Cleared after the first failed Bulk request so later batches go straight to PUT
+        self._bulk_supported = True
 
     def _fetch_data(self, fetch_func, description: str):
         """Helper function to fetch data and handle errors."""
@@ -29,6 +47,23 @@ class OmniSync:
             print(f"\n❌ Error fetching {description}: {str(e)}")
             return None # Indicate failure
 
+    def _fetch_omni_users(self, prefetch: bool = False):
+        """
+        Fetch users from Omni. With prefetch, the data source does its one-time
+        parsing (e.g. the CSV groups index, only needed by group syncs) on a worker thread meanwhile.
+        """
+        if not prefetch:
+            return self._fetch_data(self.omni_client.get_users, "users from Omni")
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            prefetch_future = executor.submit(self.data_source.prefetch)
+            omni_users = self._fetch_data(self.omni_client.get_users, "users from Omni")
+            try:
+                prefetch_future.result()
+            except Exception as e:
+                # Not fatal: the sync reads the data source again and handles any error there
+                print(f"\n⚠️ Error preparing {type(self.data_source).__name__}: {str(e)}")
+        return omni_users
+
     def _process_user_attributes(self, user: Dict[str, Any], current_user: Dict[str, Any]) -> Dict[str, int]:
         """Process attribute updates for a single user"""
         results = {'attempted': 0, 'succeeded': 0}
@@ -39,20 +74,20 @@ class OmniSync:
         
         # Check if updates are needed
         if current_attrs != desired_attrs:
-            print(f"\n🔄 Updating attributes for {user.get('userName')}")
-            print(f"  Current attributes: {json.dumps(current_attrs, indent=2)}")
-            print(f"  Desired attributes: {json.dumps(desired_attrs, indent=2)}")
+            log.info(f"\n🔄 Updating attributes for {user.get('userName')}")
+            log.info(f"  Current attributes: {json.dumps(current_attrs, indent=2)}")
+            log.info(f"  Desired attributes: {json.dumps(desired_attrs, indent=2)}")
             
             try:
                 results['attempted'] += 1
 
                 # Filter out null values from desired attributes
                 filtered_attrs = {k: v for k, v in desired_attrs.items() if v is not None}
-                print(f"  Filtered attributes: {json.dumps(filtered_attrs, indent=2)}")
+                log.info(f"  Filtered attributes: {json.dumps(filtered_attrs, indent=2)}")
 
                 # Create the update data with the filtered attributes
                 update_data = {
-                    "schemas": ["urn:ietf:params:scim:schemas:core:2.0:User"],
+                    "schemas": SCIM_USER_SCHEMAS,
                     "id": current_user['id'],
                     "userName": current_user['userName'],
                     "displayName": current_user['displayName'],
@@ -60,149 +95,274 @@ class OmniSync:
                 }
 
                 if self.dry_run:
-                    print(f"  🔍 [DRY RUN] Would send update data: {json.dumps(update_data, indent=2)}")
-                    print(f"    🔍 [DRY RUN] Would update attributes")
+                    log.info(f"  🔍 [DRY RUN] Would send update data: {json.dumps(update_data, indent=2)}")
+                    log.info(f"    🔍 [DRY RUN] Would update attributes")
                     results['succeeded'] += 1
                 else:
-                    print(f"  Sending update data: {json.dumps(update_data, indent=2)}")
+                    log.info(f"  Sending update data: {json.dumps(update_data, indent=2)}")
+                    # The client prints its own errors; write out the buffered context first
+                    flush_logger(log)
                     self.omni_client.update_user(update_data)
-                    print(f"    ✅ Successfully updated attributes")
+                    log.info(f"    ✅ Successfully updated attributes")
                     results['succeeded'] += 1
             except Exception as e:
-                print(f"    ❌ Failed to update attributes: {str(e)}")
+                log.error(f"    ❌ Failed to update attributes: {str(e)}")
                 if hasattr(e, 'response') and e.response is not None:
-                    print(f"    Response: {e.response.text}")
+                    log.error(f"    Response: {e.response.text}")
         
         return results
 
+    def _flush_group_updates(self, pending_updates: List[Dict[str, Any]], id_to_username: Dict[str, str]) -> int:
+        """
+        Send queued group membership changes as a single SCIM Bulk request.
+
+        Each pending entry holds the Omni group, the PATCH operations for its
+        managed members, and the member sets needed to rebuild the full member
+        list if the Bulk endpoint (or PATCH through it) is unavailable and we fall
+        back to one PUT per group.
+        Returns the number of groups updated successfully.
+        """
+        succeeded = 0
+        put_updates = pending_updates
+        if self._bulk_supported:
+            bulk_operations = [
+                {
+                    "method": "PATCH",
+                    "bulkId": entry['group']['id'],
+                    "path": f"/groups/{entry['group']['id']}",
+                    "data": {
+                        "schemas": SCIM_PATCH_OP_SCHEMAS,
+                        "Operations": entry['operations']
+                    }
+                }
+                for entry in pending_updates
+            ]
+            # The client prints its own errors; write out the buffered context first
+            flush_logger(log)
+            try:
+                response = self.omni_client.bulk_patch_groups(bulk_operations)
+            except Exception as e:
+                log.warning(f"\n⚠️ Bulk group update failed ({str(e)}), falling back to one PUT per group")
+                self._bulk_supported = False
+            else:
+                # Match results to groups by bulkId (or the /groups/<id> location),
+                # never by position: servers may reorder or omit results
+                statuses = {}
+                for result in (response or {}).get('Operations', []):
+                    group_id = result.get('bulkId') or str(result.get('location') or '').rstrip('/').rsplit('/', 1)[-1]
+                    status = result.get('status')
+                    if isinstance(status, dict):
+                        # Older SCIM drafts nest the status code
+                        status = status.get('code')
+                    statuses[group_id] = status
+
+                put_updates = []
+                for entry in pending_updates:
+                    group_id = entry['group']['id']
+                    group_name = entry['group'].get('displayName', group_id)
+                    status = str(statuses.get(group_id))
+                    if group_id not in statuses:
+                        log.error(f"  ❌ Failed to update group membership: {group_name} (no result in Bulk response)")
+                    elif status.startswith('2'):
+                        log.info(f"  ✅ Successfully updated group membership: {group_name}")
+                        succeeded += 1
+                    elif status in self.BULK_UNSUPPORTED_STATUSES:
+                        # The server accepts /bulk but not PATCH operations through it
+                        put_updates.append(entry)
+                    else:
+                        log.error(f"  ❌ Failed to update group membership: {group_name} (status: {status})")
+
+                if put_updates:
+                    log.warning(f"\n⚠️ Bulk PATCH rejected for {len(put_updates)} groups, falling back to one PUT per group")
+                    self._bulk_supported = False
+
+                # Add delay to avoid rate limiting
+                time.sleep(0.5)
+
+        for entry in put_updates:
+            group = entry['group']
+            group_name = group.get('displayName', group['id'])
+            # Materialize the full SCIM member list only now that a PUT is needed:
+            # unmanaged members as-is (existing display names) plus desired managed members
+            members_list = [entry['member_details'][user_id] for user_id in entry['unmanaged']]
+            members_list.extend(
+                {"display": id_to_username.get(user_id, user_id), "value": user_id}
+                for user_id in entry['desired']
+            )
+            flush_logger(log)
+            try:
+                success = self.omni_client.update_group_members(
+                    group['id'],
+                    group_name,
+                    members_list,
+                    display_name=group_name
+                )
+                if success:
+                    log.info(f"  ✅ Successfully updated group membership: {group_name}")
+                    succeeded += 1
+                else:
+                    log.error(f"  ❌ Failed to update group membership: {group_name}")
+            except Exception as e:
+                log.error(f"  ❌ Failed to update group {group_name}: {str(e)}")
+
+            # Add delay to avoid rate limiting
+            time.sleep(0.5)
+        return succeeded
+
     def sync_groups(self) -> Dict[str, Dict[str, int]]:
-        """Synchronize group memberships using group-centric approach (PUT to groups endpoint)"""
+        """Synchronize group memberships using group-centric approach (SCIM Bulk PATCH, with PUT fallback)"""
         error_result = {'groups': {'attempted': 0, 'succeeded': 0}}
 
-        # Fetch all groups from Omni
-        omni_groups = self._fetch_data(self.omni_client.get_groups, "groups from Omni")
-        if omni_groups is None:
-            print("\n❌ Failed to fetch groups from Omni. Cannot proceed with sync.")
-            return error_result
-
         # Fetch all users from Omni and create username->id and id->username mappings
-        omni_users = self._fetch_data(self.omni_client.get_users, "users from Omni")
+        omni_users = self._fetch_omni_users(prefetch=True)
         if omni_users is None:
             print("\n❌ Failed to fetch users from Omni. Cannot proceed with sync.")
             return error_result
         username_to_id = {user['userName']: user['id'] for user in omni_users}
         id_to_username = {user['id']: user['userName'] for user in omni_users}
 
-        # Fetch desired state from data source
-        desired_users = self._fetch_data(self.data_source.get_users, f"users from {type(self.data_source).__name__}")
-        if desired_users is None:
+        # Build desired group memberships: {group_id: set of user_ids}, and a
+        # digest of each user's desired groups for incremental syncs, in a single
+        # streaming pass over the data source
+        desired_group_members = {}
+        desired_digests = {}
+        source_user_count = 0
+        try:
+            for user in self.data_source.iter_users():
+                source_user_count += 1
+                username = user.get('userName')
+                if not username:
+                    continue
+
+                user_id = username_to_id.get(username)
+                if not user_id:
+                    log.warning(f"\n⚠️ User {username} from data source not found in Omni, skipping")
+                    continue
+
+                # Get desired groups for this user (CSV sources read them from the
+                # groups file's pre-built index, JSON sources from the user record)
+                desired_groups = self.data_source.get_desired_groups(user, user_id)
+                desired_digests[username] = groups_digest(desired_groups)
+                for group_id in desired_groups:
+                    if group_id:
+                        if group_id not in desired_group_members:
+                            desired_group_members[group_id] = set()
+                        desired_group_members[group_id].add(user_id)
+        except Exception as e:
+            flush_logger(log)
+            print(f"\n❌ Error reading users from {type(self.data_source).__name__}: {str(e)}")
             print("\n❌ Failed to fetch users from data source. Cannot proceed with sync.")
             return error_result
 
-        # Build desired group memberships: {group_id: set of user_ids}
-        desired_group_members = {}
-        for user in desired_users:
-            username = user.get('userName')
-            if not username:
-                continue
+        # Freeze the desired memberships now that they are complete (frozensets cache their hash)
+        desired_group_members = {group_id: frozenset(user_ids) for group_id, user_ids in desired_group_members.items()}
 
-            user_id = username_to_id.get(username)
-            if not user_id:
-                print(f"\n⚠️ User {username} from data source not found in Omni, skipping")
-                continue
+        flush_logger(log)
+        print(f"\n✅ Read {source_user_count} users from {type(self.data_source).__name__}")
 
-            # Get desired groups for this user
-            user_groups = user.get('groups', [])
-            for group in user_groups:
-                group_id = group.get('value') if isinstance(group, dict) else group
-                if group_id:
-                    if group_id not in desired_group_members:
-                        desired_group_members[group_id] = set()
-                    desired_group_members[group_id].add(user_id)
+        # Skip the group fetch and diff entirely when no user's desired groups
+        # changed since the last successful sync of this Omni instance from this source
+        state_target = f"{self.omni_client.base_url}|{self.data_source.source_key()}"
+        if not self.force_refresh and desired_digests == load_sync_state(self.state_file, state_target):
+            print("\n✅ No group membership changes in data source since last sync, skipping groups sync (use --force-refresh to resync)")
+            return error_result
+
+        # Fetch all groups from Omni
+        # Strict fetch: a partial listing must not be mistaken for the full set of groups
+        omni_groups = self._fetch_data(lambda: self.omni_client.get_groups(strict=True), "groups from Omni")
+        if omni_groups is None:
+            print("\n❌ Failed to fetch groups from Omni. Cannot proceed with sync.")
+            return error_result
 
         # Build set of managed user IDs (users we have in our source data)
         managed_user_ids = set(username_to_id.values())
 
-        # Process each group
+        # Process each group, queueing changes for SCIM Bulk submission
+        pending_updates = []
         for group in omni_groups:
             group_id = group['id']
             group_name = group.get('displayName', group_id)
 
-            # Get current members and separate into managed vs unmanaged
-            current_managed = set()  # Users in our source data
-            current_unmanaged = set()  # Embed users, external users, etc.
-            current_member_details = {}  # Keep display names
-
+            # Index current members by user ID (keeps display names)
+            current_member_details = {}
             for member in group.get('members', []):
                 member_id = member.get('value') if isinstance(member, dict) else member
                 if member_id:
                     current_member_details[member_id] = member
-                    if member_id in managed_user_ids:
-                        current_managed.add(member_id)
-                    else:
-                        current_unmanaged.add(member_id)
+
+            # Separate into managed (users in our source data) and unmanaged
+            # (embed users, external users, etc.) with set operations on the key view
+            current_managed = current_member_details.keys() & managed_user_ids
+            current_unmanaged = current_member_details.keys() - managed_user_ids
 
             # Get desired managed members from source data
-            desired_managed = desired_group_members.get(group_id, set())
-
-            # Check if managed members need updating
-            if current_managed != desired_managed:
-                print(f"\n🔄 Updating group: {group_name} ({group_id})")
-                print(f"  Current managed members: {len(current_managed)}")
-                print(f"  Desired managed members: {len(desired_managed)}")
-                if current_unmanaged:
-                    print(f"  ⚠️  Preserving {len(current_unmanaged)} unmanaged members (embed users, external users, etc.)")
-
-                members_to_add = desired_managed - current_managed
-                members_to_remove = current_managed - desired_managed
-
-                if members_to_add:
-                    print(f"  ➕ Adding {len(members_to_add)} managed members")
-                if members_to_remove:
-                    print(f"  ➖ Removing {len(members_to_remove)} managed members")
-
-                # Build final member list: unmanaged (preserved) + desired managed
-                final_members = current_unmanaged | desired_managed
-
-                # Build members list for API (needs both display and value fields)
-                members_list = []
-
-                # Add unmanaged members (preserve their existing display names)
-                for user_id in current_unmanaged:
-                    if user_id in current_member_details:
-                        members_list.append(current_member_details[user_id])
-                    else:
-                        members_list.append({"value": user_id})
+            desired_managed = desired_group_members.get(group_id, frozenset())
+
+            # Unchanged groups (the common case in steady-state syncs) cost one
+            # equality check, which bails out on a length mismatch, and no diff sets
+            if current_managed == desired_managed:
+                continue
 
-                # Add managed members from our source
-                for user_id in desired_managed:
-                    members_list.append({
-                        "display": id_to_username.get(user_id, user_id),
-                        "value": user_id
-                    })
+            # The sets differ, so at least one of these is non-empty
+            members_to_add = desired_managed - current_managed
+            members_to_remove = current_managed - desired_managed
+
+            log.info(f"\n🔄 Updating group: {group_name} ({group_id})")
+            log.info(f"  Current managed members: {len(current_managed)}")
+            log.info(f"  Desired managed members: {len(desired_managed)}")
+            if current_unmanaged:
+                log.warning(f"  ⚠️  Preserving {len(current_unmanaged)} unmanaged members (embed users, external users, etc.)")
+
+            if members_to_add:
+                log.info(f"  ➕ Adding {len(members_to_add)} managed members")
+            if members_to_remove:
+                log.info(f"  ➖ Removing {len(members_to_remove)} managed members")
+
+            # PATCH operations only carry the delta for managed members. Removals
+            # use a value filter per member: per RFC 7644 an unfiltered remove on
+            # "members" clears every member, including the unmanaged ones
+            operations = []
+            if members_to_add:
+                operations.append({
+                    "op": "add",
+                    "path": "members",
+                    "value": [
+                        {"display": id_to_username.get(user_id, user_id), "value": user_id}
+                        for user_id in members_to_add
+                    ]
+                })
+            operations.extend(
+                {"op": "remove", "path": f'members[value eq "{user_id}"]'}
+                for user_id in members_to_remove
+            )
+
+            error_result['groups']['attempted'] += 1
+            if self.dry_run:
+                log.info(f"  🔍 [DRY RUN] Would update group membership")
+                error_result['groups']['succeeded'] += 1
+                continue
 
-                try:
-                    error_result['groups']['attempted'] += 1
-                    if self.dry_run:
-                        print(f"  🔍 [DRY RUN] Would update group membership")
-                        error_result['groups']['succeeded'] += 1
-                    else:
-                        success = self.omni_client.update_group_members(
-                            group_id,
-                            group_name,
-                            members_list,
-                            display_name=group.get('displayName', group_name)
-                        )
-                        if success:
-                            print(f"  ✅ Successfully updated group membership")
-                            error_result['groups']['succeeded'] += 1
-                        else:
-                            print(f"  ❌ Failed to update group membership")
-                except Exception as e:
-                    print(f"  ❌ Failed to update group: {str(e)}")
+            pending_updates.append({
+                'group': group,
+                'operations': operations,
+                'member_details': current_member_details,
+                'unmanaged': current_unmanaged,
+                'desired': desired_managed
+            })
+            if len(pending_updates) >= self.BULK_FLUSH_SIZE:
+                error_result['groups']['succeeded'] += self._flush_group_updates(pending_updates, id_to_username)
+                pending_updates = []
 
-                # Add delay to avoid rate limiting
-                time.sleep(0.5)
+        if pending_updates:
+            error_result['groups']['succeeded'] += self._flush_group_updates(pending_updates, id_to_username)
+
+        flush_logger(log)
+
+        # Only record the state once every update went through against a non-empty
+        # groups listing, so failures are retried next run
+        if (not self.dry_run and omni_groups
+                and error_result['groups']['attempted'] == error_result['groups']['succeeded']):
+            save_sync_state(self.state_file, state_target, desired_digests)
 
         print("\n📊 Groups Sync Summary:")
         print(f"Total groups processed: {len(omni_groups)}")
@@ -216,46 +376,53 @@ class OmniSync:
         error_result = {'attributes': {'attempted': 0, 'succeeded': 0}}
 
         # Fetch all users from Omni once and cache them
-        omni_users = self._fetch_data(self.omni_client.get_users, "users from Omni")
+        omni_users = self._fetch_omni_users()
         if omni_users is None:
             print("\n❌ Failed to fetch users from Omni. Cannot proceed with sync.")
             return error_result
         omni_user_map = {user['userName']: user for user in omni_users}
 
-        users = self._fetch_data(self.data_source.get_users, f"users from {type(self.data_source).__name__}")
-        if users is None:
-            print("\n❌ Failed to fetch users from data source. Cannot proceed with sync.")
-            return error_result
-
-        for user in users:
-            try:
-                user_name = user.get('userName')
-                if not user_name:
-                    print(f"\n⚠️ Skipping user record with missing 'userName': {user}")
-                    continue
+        # Stream users from the data source rather than loading them all up front
+        total_users = 0
+        try:
+            for user in self.data_source.iter_users():
+                total_users += 1
+                try:
+                    user_name = user.get('userName')
+                    if not user_name:
+                        log.warning(f"\n⚠️ Skipping user record with missing 'userName': {user}")
+                        continue
+
+                    # Look up user from cache instead of API call
+                    current_user = omni_user_map.get(user_name)
+                    if not current_user:
+                        log.warning(f"\n⚠️ User not found in Omni: {user_name}")
+                        continue
+
+                    attr_results = self._process_user_attributes(user, current_user)
+                    error_result['attributes']['attempted'] += attr_results['attempted']
+                    error_result['attributes']['succeeded'] += attr_results['succeeded']
+
+                    # Add delay to avoid rate limiting, but only when a request was sent.
+                    # Users whose attributes already match cost no API calls.
+                    if attr_results['attempted'] and not self.dry_run:
+                        time.sleep(0.3)
 
-                # Look up user from cache instead of API call
-                current_user = omni_user_map.get(user_name)
-                if not current_user:
-                    print(f"\n⚠️ User not found in Omni: {user_name}")
+                except Exception as e:
+                    user_name_for_error = user.get('userName', '[UNKNOWN USERNAME]')
+                    log.error(f"\n❌ An unexpected error occurred processing user {user_name_for_error}: {str(e)}")
+                    # Add delay even on error to avoid rate limiting
+                    time.sleep(0.3)
                     continue
+        except Exception as e:
+            flush_logger(log)
+            print(f"\n❌ Error reading users from {type(self.data_source).__name__}: {str(e)}")
+            print("\n❌ Failed to fetch users from data source. Cannot proceed with sync.")
+            return error_result
 
-                attr_results = self._process_user_attributes(user, current_user)
-                error_result['attributes']['attempted'] += attr_results['attempted']
-                error_result['attributes']['succeeded'] += attr_results['succeeded']
-
-                # Add delay to avoid rate limiting
-                time.sleep(0.3)
-
-            except Exception as e:
-                user_name_for_error = user.get('userName', '[UNKNOWN USERNAME]')
-                print(f"\n❌ An unexpected error occurred processing user {user_name_for_error}: {str(e)}")
-                # Add delay even on error to avoid rate limiting
-                time.sleep(0.3)
-                continue
-
+        flush_logger(log)
         print("\n📊 Attributes Sync Summary:")
-        print(f"Total users processed: {len(users)}")
+        print(f"Total users processed: {total_users}")
         print(f"Attribute updates attempted: {error_result['attributes']['attempted']}")
         print(f"Attribute updates succeeded: {error_result['attributes']['succeeded']}")
         
@@ -1,5 +1,12 @@
 from typing import List, Dict, Optional, Any, TypedDict
 
+# Constant SCIM "schemas" values for request bodies, built once and shared by every
+# payload (tuples serialize as JSON arrays and can't be mutated by accident)
+SCIM_USER_SCHEMAS = ("urn:ietf:params:scim:schemas:core:2.0:User",)
+SCIM_PATCH_OP_SCHEMAS = ("urn:ietf:params:scim:api:messages:2.0:PatchOp",)
+SCIM_BULK_REQUEST_SCHEMAS = ("urn:ietf:params:scim:api:messages:2.0:BulkRequest",)
+SCIM_LIST_RESPONSE_SCHEMAS = ("urn:ietf:params:scim:api:messages:2.0:ListResponse",)
+
 class Email(TypedDict, total=False):
     primary: bool
     value: str
@@ -0,0 +1,47 @@
+"""Persisted state for incremental syncs: a digest of each user's desired groups from the last successful run."""
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+DEFAULT_STATE_FILE = '.omni_sync_state.json'
+
+
+def groups_digest(group_ids: Iterable[Any]) -> str:
+    """Return a stable digest of a set of group IDs (order-independent; empty IDs are ignored)."""
+    return hashlib.blake2b(
+        b"\0".join(sorted(str(group_id).encode('utf-8') for group_id in group_ids if group_id)),
+        digest_size=16
+    ).hexdigest()
+
+
+def _read_state_file(path: str) -> Dict[str, Any]:
+    """Read the whole state file: {target key: {userName: digest}}. Missing or unreadable files read as empty."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        return state if isinstance(state, dict) else {}
+    except FileNotFoundError:
+        return {}
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"\n⚠️ Could not read sync state from {path}, running a full sync: {str(e)}")
+        return {}
+
+
+def load_sync_state(path: str, target: str) -> Optional[Dict[str, str]]:
+    """
+    Load the {userName: digest} map saved by the last sync of this target
+    (Omni instance + data source), or None if there is no usable state for it.
+    """
+    state = _read_state_file(path).get(target)
+    return state if isinstance(state, dict) else None
+
+
+def save_sync_state(path: str, target: str, state: Dict[str, str]) -> None:
+    """Write the {userName: digest} map for the next incremental sync of this target, keeping other targets."""
+    all_state = _read_state_file(path)
+    all_state[target] = state
+    try:
+        Path(path).write_text(json.dumps(all_state, indent=2, sort_keys=True), encoding='utf-8')
+    except OSError as e:
+        print(f"\n⚠️ Could not write sync state to {path}: {str(e)}")
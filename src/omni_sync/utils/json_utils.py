@@ -0,0 +1,24 @@
+"""JSON helpers that use orjson when it is installed and fall back to the stdlib json module."""
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson is an optional speedup (pip install omni-user-manager[fast])
+    orjson = None
+
+
+def loads(data):
+    """
+    Parse a JSON document from a str or bytes.
+    orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers can keep catching the latter.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj) -> bytes:
+    """Serialize obj to compact UTF-8 JSON bytes, ready to send as a request body."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
@@ -0,0 +1,30 @@
+"""Buffered console logging for the per-user and per-group progress messages of sync runs."""
+import logging
+import sys
+from logging.handlers import MemoryHandler
+
+
+def configure_logging(name: str = 'omni_sync', capacity: int = 500) -> logging.Logger:
+    """
+    Make the `name` logger print bare messages to stdout. Called by the CLI, not on import.
+    Records are buffered and written in batches of `capacity`; ERROR and above flush immediately.
+    """
+    logger = logging.getLogger(name)
+    if not logger.handlers:
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(MemoryHandler(capacity, flushLevel=logging.ERROR, target=stream_handler))
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+
+def flush_logger(logger: logging.Logger) -> None:
+    """Write out any records buffered by this logger's handlers or its ancestors', e.g. before printing directly to stdout."""
+    current = logger
+    while current is not None:
+        for handler in current.handlers:
+            handler.flush()
+        if not current.propagate:
+            break
+        current = current.parent
@@ -0,0 +1,60 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from omni_sync.sync_state import groups_digest, load_sync_state, save_sync_state
+
+
+class GroupsDigestTest(unittest.TestCase):
+    def test_order_independent(self):
+        self.assertEqual(groups_digest(['b', 'a']), groups_digest(['a', 'b']))
+
+    def test_different_groups_differ(self):
+        self.assertNotEqual(groups_digest(['a']), groups_digest(['a', 'b']))
+
+    def test_ignores_empty_ids(self):
+        self.assertEqual(groups_digest([None, '', 'a']), groups_digest(['a']))
+
+    def test_accepts_non_string_ids(self):
+        self.assertEqual(groups_digest([123]), groups_digest(['123']))
+
+
+class SyncStateFileTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'state.json')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_missing_file_has_no_state(self):
+        self.assertIsNone(load_sync_state(self.path, 'target'))
+
+    def test_round_trip(self):
+        save_sync_state(self.path, 'target', {'user@example.com': 'abc'})
+        self.assertEqual(load_sync_state(self.path, 'target'), {'user@example.com': 'abc'})
+
+    def test_targets_are_kept_separate(self):
+        save_sync_state(self.path, 'staging', {'user@example.com': 'abc'})
+        save_sync_state(self.path, 'prod', {'user@example.com': 'def'})
+        self.assertEqual(load_sync_state(self.path, 'staging'), {'user@example.com': 'abc'})
+        self.assertEqual(load_sync_state(self.path, 'prod'), {'user@example.com': 'def'})
+        self.assertIsNone(load_sync_state(self.path, 'other'))
+
+    def test_unreadable_file_has_no_state(self):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write('not json')
+        self.assertIsNone(load_sync_state(self.path, 'target'))
+
+    def test_non_dict_entry_has_no_state(self):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({'target': ['not', 'a', 'dict']}, f)
+        self.assertIsNone(load_sync_state(self.path, 'target'))
+
+
+if __name__ == '__main__':
+    unittest.main()